@@ -0,0 +1,2 @@
+# Presente en la raíz del repositorio para que pytest agregue la raíz a sys.path
+# y los tests puedan importar azure_function_example con un simple `pytest`
@@ -0,0 +1,100 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import azure_function_example as app_module
+from azure_function_example import _cache_get, _cache_put, _fetch_historical
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app_module, '_HISTORICAL_CACHE', OrderedDict())
+    monkeypatch.setattr(app_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    # Sin reloj fijo: asyncio usa time.monotonic para programar sus temporizadores
+    monkeypatch.setattr(app_module, '_HISTORICAL_CACHE', OrderedDict())
+    monkeypatch.setattr(app_module, '_HISTORICAL_INFLIGHT', {})
+
+
+def test_cache_hit_before_ttl(clock, monkeypatch):
+    monkeypatch.setattr(app_module, 'HISTORICAL_TTL_SECONDS', 60)
+    frozen = _cache_put('ACC-1', {'avg_transaction_amount': 100.0, 'common_channels': ['WEB']})
+
+    clock[0] += 59.9
+
+    assert _cache_get('ACC-1') == frozen
+    assert dict(frozen)['common_channels'] == ('WEB',)
+
+
+@pytest.mark.parametrize('elapsed', [60.0, 61.0])
+def test_cache_miss_at_or_after_ttl_deletes_entry(clock, monkeypatch, elapsed):
+    monkeypatch.setattr(app_module, 'HISTORICAL_TTL_SECONDS', 60)
+    _cache_put('ACC-1', {'avg_transaction_amount': 100.0})
+
+    clock[0] += elapsed
+
+    assert _cache_get('ACC-1') is None
+    assert 'ACC-1' not in app_module._HISTORICAL_CACHE
+
+
+def test_cache_evicts_least_recently_used_entry(clock, monkeypatch):
+    monkeypatch.setattr(app_module, 'HISTORICAL_CACHE_SIZE', 2)
+    _cache_put('ACC-1', {'avg_transaction_amount': 1.0})
+    _cache_put('ACC-2', {'avg_transaction_amount': 2.0})
+
+    # Leer ACC-1 lo convierte en la entrada más reciente, dejando ACC-2 como la menos usada
+    assert _cache_get('ACC-1') is not None
+    _cache_put('ACC-3', {'avg_transaction_amount': 3.0})
+
+    assert list(app_module._HISTORICAL_CACHE) == ['ACC-1', 'ACC-3']
+    assert _cache_get('ACC-2') is None
+
+
+def test_concurrent_misses_share_one_load(empty_cache, monkeypatch):
+    calls = []
+
+    async def fake_load(account_number):
+        calls.append(account_number)
+        await asyncio.sleep(0.01)
+        return _cache_put(account_number, {'avg_transaction_amount': 1.0})
+
+    monkeypatch.setattr(app_module, '_load_historical', fake_load)
+
+    async def run():
+        return await asyncio.gather(*(_fetch_historical('ACC-1') for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert calls == ['ACC-1']
+    assert all(result == results[0] for result in results)
+    assert app_module._HISTORICAL_INFLIGHT == {}
+
+
+def test_failed_load_is_not_cached_and_is_retried(empty_cache, monkeypatch):
+    calls = []
+
+    async def failing_load(account_number):
+        calls.append(account_number)
+        await asyncio.sleep(0.01)
+        raise RuntimeError('upstream')
+
+    monkeypatch.setattr(app_module, '_load_historical', failing_load)
+
+    async def run():
+        return await asyncio.gather(*(_fetch_historical('ACC-1') for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert calls == ['ACC-1']
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert 'ACC-1' not in app_module._HISTORICAL_CACHE
+    assert app_module._HISTORICAL_INFLIGHT == {}
+
+    asyncio.run(run())
+    assert calls == ['ACC-1', 'ACC-1']
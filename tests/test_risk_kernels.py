@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from azure_function_example import _risk_kernel, _risk_kernel_vectorized
+
+
+def _random_inputs(rng, n):
+    return (
+        rng.uniform(0, 5000, n),
+        rng.uniform(0, 1500, n),
+        rng.uniform(0, 300, n),
+        rng.integers(0, 400, n).astype(np.float64),
+        rng.uniform(0, 60, n),
+        rng.integers(0, 3000, n).astype(np.float64),
+    )
+
+
+def _assert_kernels_match(inputs):
+    vectorized = _risk_kernel_vectorized(*inputs)
+    for i in range(len(inputs[0])):
+        scalar = _risk_kernel(*(float(column[i]) for column in inputs))
+        assert len(scalar) == len(vectorized)
+        for expected, column in zip(scalar, vectorized):
+            assert column[i] == pytest.approx(expected)
+
+
+def test_vectorized_kernel_matches_scalar_kernel():
+    _assert_kernels_match(_random_inputs(np.random.default_rng(0), 500))
+
+
+def test_vectorized_kernel_matches_scalar_kernel_with_zero_std_and_avg():
+    amount, avg_amount, std_amount, count, days, age = _random_inputs(np.random.default_rng(1), 200)
+    std_amount[::2] = 0.0
+    avg_amount[::3] = 0.0
+    _assert_kernels_match((amount, avg_amount, std_amount, count, days, age))